@@ -9,27 +9,47 @@ import time
 import threading
 import sys
 import os
+import bisect
+import collections
+import heapq
+import selectors
 
 SEQ_NUM_SIZE = 4  
 CHECKSUM_SIZE = 2  
 ACK_SIZE = 4 
 CHUNK_SIZE = 1024  
 
-TIMEOUT = 0.5  
+HEADER_STRUCT = struct.Struct('!IH')  # seq_num, checksum
+ACK_STRUCT = struct.Struct('!I')  
+
+TIMEOUT = 0.5  # initial RTO, before any RTT sample
+SEND_TIMEOUT = 0.5  # how long sendto may wait on a full socket buffer
+MIN_RTO = 0.2  # kept well above the server's 100 ms delayed-ACK timer
+MAX_RTO = 2.0  
 INITIAL_CWND = 1  
 INITIAL_SSTHRESH = 64  
 FAST_RETRANSMIT_DUP_ACKS = 3  
+LSS_THRESH = 100  # max_ssthresh for RFC 3742 limited slow start
+RETRANSMIT_SAMPLE_INTERVAL = 0.001  
 
 class TCPClient:
     def __init__(self, server_host='localhost', server_port=8888):
         self.server_host = server_host
         self.server_port = server_port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.settimeout(TIMEOUT)
+        self.sock.settimeout(SEND_TIMEOUT)
+        # Non-blocking handle on the same socket so the receiver thread can
+        # drain every queued ACK without the timeout poll before each recv
+        self.ack_sock = socket.socket(fileno=os.dup(self.sock.fileno()))
+        self.ack_sock.setblocking(False)
         
         self.file_data = None
         self.total_chunks = 0
+        self.end_seq = -1
         self.chunks = [] 
+        self.chunk_sizes = {}  # {seq_num: len(chunk_data)}
+        self.chunk_checksums = {}  # {seq_num: checksum}
+        self.packet_cache = {}  # {seq_num: packet}
         
         self.cwnd = INITIAL_CWND  
         self.ssthresh = INITIAL_SSTHRESH 
@@ -38,23 +58,31 @@ class TCPClient:
         self.next_seq_to_send = 0  
         self.last_acked_seq = -1  
         self.unacked_packets = {}  # {seq_num: (packet_data, send_time, retransmit_count)}
+        self.unacked_seqs = []  # sorted keys of unacked_packets
+        self.timeout_heap = []  # [(deadline, seq_num, generation), ...]
+        self.send_generation = {}  # {seq_num: generation of its latest send}
         self.last_ack_received = -1 
         self.duplicate_ack_count = 0 
 
         self.rtt_samples = []  
         self.current_rtt = 0.1 
+        self.rttvar = 0.0 
+        self.rto = TIMEOUT 
         
         self.metrics = {
             'cwnd_history': [],  # [(time, cwnd), ...]
             'retransmission_history': [],  # [(time, count), ...]
             'start_time': None
         }
+        self.last_cwnd_sample_rtt = -1
         
         self.total_retransmissions = 0
         self.timeout_retransmissions = 0
         self.fast_retransmissions = 0
         
-        self.lock = threading.Lock()
+        # ACK numbers handed from the receiver thread to the sending thread
+        self.ack_queue = collections.deque()
+        self.ack_event = threading.Event()
         
     def calculate_checksum(self, data):
         if not data:
@@ -63,11 +91,10 @@ class TCPClient:
         return checksum
     
     def create_packet(self, seq_num, data):
-        checksum = self.calculate_checksum(data)
-        packet = struct.pack('!I', seq_num)  
-        packet += struct.pack('!H', checksum)  
-        packet += data  
-        return packet
+        checksum = self.chunk_checksums.get(seq_num)
+        if checksum is None:
+            checksum = self.calculate_checksum(data)
+        return HEADER_STRUCT.pack(seq_num, checksum) + data
     
     def read_file(self, filename):
         try:
@@ -76,48 +103,60 @@ class TCPClient:
             
             self.chunks = []
             seq_num = 0
+            # Zero-copy views into file_data instead of a bytes copy per chunk
+            file_view = memoryview(self.file_data)
             for i in range(0, len(self.file_data), CHUNK_SIZE):
-                chunk_data = self.file_data[i:i+CHUNK_SIZE]
+                chunk_data = file_view[i:i+CHUNK_SIZE]
                 self.chunks.append((seq_num, chunk_data))
                 seq_num += len(chunk_data)
             
+            self.chunk_sizes = {seq: len(chunk_data) for seq, chunk_data in self.chunks}
+            self.chunk_checksums = {seq: self.calculate_checksum(chunk_data) for seq, chunk_data in self.chunks}
+            self.packet_cache = {seq: self.create_packet(seq, chunk_data) for seq, chunk_data in self.chunks}
             self.total_chunks = len(self.chunks)
+            if self.chunks:
+                self.end_seq = self.chunks[-1][0] + len(self.chunks[-1][1]) - 1
             print(f"File read: {len(self.file_data)} bytes, {self.total_chunks} chunks")
             return True
         except Exception as e:
             print(f"Error reading file: {e}")
             return False
     
-    def can_send_more(self):
-        with self.lock:
-            in_flight_count = 0
-            for seq in self.unacked_packets.keys():
-                packet_size = None
-                for s, chunk_data in self.chunks:
-                    if s == seq:
-                        packet_size = len(chunk_data)
-                        break
-                if packet_size:
-                    if seq + packet_size > self.last_acked_seq + 1:
-                        in_flight_count += 1
-            
-            return in_flight_count < int(self.cwnd)
+    def available_window(self):
+        in_flight_count = sum(
+            1 for seq in self.unacked_packets
+            if seq + self.chunk_sizes[seq] > self.last_acked_seq + 1
+        )
+        
+        return int(self.cwnd) - in_flight_count
     
-    def send_packet(self, seq_num, data, is_retransmit=False):
-        packet = self.create_packet(seq_num, data)
+    def send_packets(self, chunks):
+        server_addr = (self.server_host, self.server_port)
+        for seq_num, _ in chunks:
+            packet = self.packet_cache[seq_num]
+            self.sock.sendto(packet, server_addr)
+            self.track_sent_packet(seq_num, packet)
+    
+    def send_packet(self, seq_num, is_retransmit=False):
+        packet = self.packet_cache[seq_num]
         self.sock.sendto(packet, (self.server_host, self.server_port))
-        
-        send_time = time.time()
+        self.track_sent_packet(seq_num, packet, is_retransmit)
+    
+    def schedule_timeout(self, seq_num, send_time):
+        generation = self.send_generation.get(seq_num, 0) + 1
+        self.send_generation[seq_num] = generation
+        heapq.heappush(self.timeout_heap, (send_time + self.rto, seq_num, generation))
+    
+    def track_sent_packet(self, seq_num, packet, is_retransmit=False):
+        send_time = time.monotonic()
+        self.schedule_timeout(seq_num, send_time)
         if seq_num not in self.unacked_packets:
             self.unacked_packets[seq_num] = (packet, send_time, 0)
+            bisect.insort(self.unacked_seqs, seq_num)
             if is_retransmit:
                 self.total_retransmissions += 1
                 self.timeout_retransmissions += 1
-                with self.lock:
-                    self.metrics['retransmission_history'].append((
-                        time.time() - self.metrics['start_time'],
-                        self.total_retransmissions
-                    ))
+                self.record_retransmission(send_time)
         else:
             old_packet, old_time, retransmit_count = self.unacked_packets[seq_num]
             self.unacked_packets[seq_num] = (packet, send_time, retransmit_count + 1)
@@ -126,164 +165,205 @@ class TCPClient:
                 self.timeout_retransmissions += 1
             else:
                 self.fast_retransmissions += 1
-            with self.lock:
-                self.metrics['retransmission_history'].append((
-                    time.time() - self.metrics['start_time'],
-                    self.total_retransmissions
-                ))
+            self.record_retransmission(send_time)
+    
+    def record_retransmission(self, now):
+        elapsed = now - self.metrics['start_time']
+        history = self.metrics['retransmission_history']
+        # Fold retransmissions closer together than the sample interval into one point
+        if history and elapsed - history[-1][0] < RETRANSMIT_SAMPLE_INTERVAL:
+            history[-1] = (history[-1][0], self.total_retransmissions)
+        else:
+            history.append((elapsed, self.total_retransmissions))
     
     def handle_ack(self, ack_num):
-        with self.lock:
-            if ack_num == self.last_ack_received:
-                self.duplicate_ack_count += 1
+        now = time.monotonic()
+        
+        if ack_num == self.last_ack_received:
+            self.duplicate_ack_count += 1
+            
+            if self.duplicate_ack_count == FAST_RETRANSMIT_DUP_ACKS:
+                # Fast retransmit
+                retransmit_seq = ack_num
                 
-                if self.duplicate_ack_count == FAST_RETRANSMIT_DUP_ACKS:
-                    # Fast retransmit
-                    retransmit_seq = ack_num
+                if retransmit_seq in self.packet_cache:
+                    packet = self.packet_cache[retransmit_seq]
+                    self.sock.sendto(packet, (self.server_host, self.server_port))
                     
-                    chunk_data = None
-                    for seq, data in self.chunks:
-                        if seq == retransmit_seq:
-                            chunk_data = data
-                            break
+                    send_time = now
+                    self.schedule_timeout(retransmit_seq, send_time)
+                    if retransmit_seq in self.unacked_packets:
+                        old_packet, old_time, retransmit_count = self.unacked_packets[retransmit_seq]
+                        self.unacked_packets[retransmit_seq] = (packet, send_time, retransmit_count + 1)
+                    else:
+                        self.unacked_packets[retransmit_seq] = (packet, send_time, 1)
+                        bisect.insort(self.unacked_seqs, retransmit_seq)
                     
-                    if chunk_data is not None:
-                        packet = self.create_packet(retransmit_seq, chunk_data)
-                        self.sock.sendto(packet, (self.server_host, self.server_port))
-                        
-                        send_time = time.time()
-                        if retransmit_seq in self.unacked_packets:
-                            old_packet, old_time, retransmit_count = self.unacked_packets[retransmit_seq]
-                            self.unacked_packets[retransmit_seq] = (packet, send_time, retransmit_count + 1)
-                        else:
-                            self.unacked_packets[retransmit_seq] = (packet, send_time, 1)
-                        
-                        self.total_retransmissions += 1
-                        self.fast_retransmissions += 1
-                        self.metrics['retransmission_history'].append((
-                            time.time() - self.metrics['start_time'],
-                            self.total_retransmissions
-                        ))
-                        
-                        self.ssthresh = max(int(self.cwnd / 2), 2)
-                        self.cwnd = self.ssthresh + 3  
-                        self.state = 'congestion_avoidance'
-                        
-                        self.duplicate_ack_count = 0
-                
-                return 
-            
-            # New ACK 
-            if ack_num > self.last_ack_received:
-                self.duplicate_ack_count = 0
-                self.last_ack_received = ack_num
-                
-                acked_packets = []
-                for seq in list(self.unacked_packets.keys()):
-                    packet_size = None
-                    for s, chunk_data in self.chunks:
-                        if s == seq:
-                            packet_size = len(chunk_data)
-                            break
+                    self.total_retransmissions += 1
+                    self.fast_retransmissions += 1
+                    self.record_retransmission(now)
                     
-                    if packet_size and seq + packet_size <= ack_num:
-                        acked_packets.append(seq)
-                
-                for seq in acked_packets:
-                    packet_data, send_time, retransmit_count = self.unacked_packets.pop(seq, (None, None, None))
-                    if packet_data and send_time:
-                        rtt = time.time() - send_time
-                        self.rtt_samples.append(rtt)
-                        if len(self.rtt_samples) == 1:
-                            self.current_rtt = rtt
-                        else:
-                            self.current_rtt = 0.875 * self.current_rtt + 0.125 * rtt
-                
-                self.last_acked_seq = max(self.last_acked_seq, ack_num - 1)
-                
-                packets_acked = len(acked_packets)
-                
-                if self.state == 'slow_start':
+                    self.ssthresh = max(int(self.cwnd / 2), 2)
+                    self.cwnd = self.ssthresh + 3  
+                    self.state = 'congestion_avoidance'
+                    
+                    self.duplicate_ack_count = 0
+            
+            return 
+        
+        # New ACK 
+        if ack_num > self.last_ack_received:
+            self.duplicate_ack_count = 0
+            self.last_ack_received = ack_num
+            
+            # Chunks start on ACK boundaries, so every seq below ack_num is fully acked
+            acked_count = bisect.bisect_left(self.unacked_seqs, ack_num)
+            acked_packets = self.unacked_seqs[:acked_count]
+            del self.unacked_seqs[:acked_count]
+            
+            for seq in acked_packets:
+                packet_data, send_time, retransmit_count = self.unacked_packets.pop(seq, (None, None, None))
+                # Karn's rule: a retransmitted packet's ACK gives an ambiguous RTT
+                if packet_data and send_time and retransmit_count == 0:
+                    rtt = now - send_time
+                    self.rtt_samples.append(rtt)
+                    if len(self.rtt_samples) == 1:
+                        self.current_rtt = rtt
+                        self.rttvar = rtt / 2
+                    else:
+                        self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.current_rtt - rtt)
+                        self.current_rtt = 0.875 * self.current_rtt + 0.125 * rtt
+                    # Jacobson/Karels RTO
+                    self.rto = max(MIN_RTO, min(MAX_RTO, self.current_rtt + 4 * self.rttvar))
+            
+            self.last_acked_seq = max(self.last_acked_seq, ack_num - 1)
+            
+            packets_acked = len(acked_packets)
+            
+            if self.state == 'slow_start':
+                if self.cwnd <= LSS_THRESH:
                     self.cwnd += packets_acked
-                    if self.cwnd >= self.ssthresh:
-                        self.state = 'congestion_avoidance'
-                else:  # congestion_avoidance
-                    self.cwnd += packets_acked / self.cwnd
-                    self.cwnd = int(self.cwnd) if self.cwnd >= 1 else 1
-                
-                current_time = time.time() - self.metrics['start_time']
-                rtt_number = int(current_time / self.current_rtt) if self.current_rtt > 0 else 0
+                else:
+                    # Limited slow start: at most LSS_THRESH / 2 packets of growth per RTT
+                    k = max(1, int(self.cwnd / (0.5 * LSS_THRESH)))
+                    self.cwnd += packets_acked / k
+                if self.cwnd >= self.ssthresh:
+                    self.state = 'congestion_avoidance'
+            else:  # congestion_avoidance
+                self.cwnd += packets_acked / self.cwnd
+                self.cwnd = int(self.cwnd) if self.cwnd >= 1 else 1
+            
+            current_time = now - self.metrics['start_time']
+            rtt_number = int(current_time / self.current_rtt) if self.current_rtt > 0 else 0
+            # One cwnd sample per RTT is enough for the cwnd vs. RTT plot
+            if rtt_number != self.last_cwnd_sample_rtt:
                 self.metrics['cwnd_history'].append((rtt_number, int(self.cwnd)))
+                self.last_cwnd_sample_rtt = rtt_number
+    
+    def drain_acks(self):
+        while self.ack_queue:
+            self.handle_ack(self.ack_queue.popleft())
     
     def check_timeouts(self):
-        current_time = time.time()
+        current_time = time.monotonic()
         timed_out_packets = []
         
-        for seq_num, (packet_data, send_time, retransmit_count) in list(self.unacked_packets.items()):
-            elapsed = current_time - send_time
-            if elapsed > TIMEOUT:
+        while self.timeout_heap and self.timeout_heap[0][0] < current_time:
+            deadline, seq_num, generation = heapq.heappop(self.timeout_heap)
+            # Skip entries for packets since acked or re-sent with a newer deadline
+            if seq_num in self.unacked_packets and self.send_generation.get(seq_num) == generation:
                 timed_out_packets.append(seq_num)
         
+        # One timeout event backs off once, however many packets expired together
+        if timed_out_packets:
+            self.ssthresh = max(int(self.cwnd / 2), 2)
+            self.cwnd = INITIAL_CWND
+            self.state = 'slow_start'
+            # Exponential backoff (RFC 6298 5.5); Karn's rule keeps retransmits from resetting it
+            self.rto = min(MAX_RTO, self.rto * 2)
+        
         for seq_num in timed_out_packets:
-            for seq, chunk_data in self.chunks:
-                if seq == seq_num:
-                    print(f"Timeout: retransmitting seq={seq_num}")
-                    self.ssthresh = max(int(self.cwnd / 2), 2)
-                    self.cwnd = INITIAL_CWND
-                    self.state = 'slow_start'
-                    self.send_packet(seq_num, chunk_data, is_retransmit=True)
-                    break
+            if seq_num in self.packet_cache:
+                print(f"Timeout: retransmitting seq={seq_num}")
+                self.send_packet(seq_num, is_retransmit=True)
+    
+    def next_timeout_delay(self):
+        if not self.timeout_heap:
+            return self.rto
+        return max(0.0, self.timeout_heap[0][0] - time.monotonic())
     
     def receiver_thread(self):
-        while True:
-            try:
-                data, addr = self.sock.recvfrom(ACK_SIZE)
-                if len(data) >= ACK_SIZE:
-                    ack_num = struct.unpack('!I', data)[0]
-                    self.handle_ack(ack_num)
-            except socket.timeout:
-                self.check_timeouts()
-                continue
-            except Exception as e:
-                if self.last_acked_seq >= self.chunks[-1][0] + len(self.chunks[-1][1]) - 1:
-                    break 
-                continue
+        sel = selectors.DefaultSelector()
+        sel.register(self.ack_sock, selectors.EVENT_READ)
+        
+        try:
+            done = False
+            while not done:
+                try:
+                    # Retransmit timeouts run on the sending thread, so only wait for ACKs
+                    sel.select()
+                    while True:
+                        try:
+                            data, addr = self.ack_sock.recvfrom(ACK_SIZE)
+                        except BlockingIOError:
+                            break
+                        if len(data) >= ACK_SIZE:
+                            ack_num = ACK_STRUCT.unpack(data)[0]
+                            self.ack_queue.append(ack_num)
+                            self.ack_event.set()
+                            # Cumulative ACK past the last byte: no more ACKs are needed
+                            if ack_num > self.end_seq:
+                                done = True
+                except Exception as e:
+                    if self.last_acked_seq >= self.end_seq:
+                        break 
+                    continue
+        finally:
+            sel.close()
+            self.ack_sock.close()
     
     def transfer_file(self, filename):
         if not self.read_file(filename):
             return False
         
-        self.metrics['start_time'] = time.time()
+        self.metrics['start_time'] = time.monotonic()
 
         receiver = threading.Thread(target=self.receiver_thread, daemon=True)
         receiver.start()
         
         chunk_index = 0
         while chunk_index < self.total_chunks:
-            while self.can_send_more() and chunk_index < self.total_chunks:
-                seq_num, chunk_data = self.chunks[chunk_index]
-                self.send_packet(seq_num, chunk_data)
-                chunk_index += 1
+            # Fill the whole open window in one pass
+            window = self.available_window()
+            if window > 0:
+                batch = self.chunks[chunk_index:chunk_index + window]
+                self.send_packets(batch)
+                chunk_index += len(batch)
             
-            time.sleep(0.01)
+            # Wake as soon as an ACK may have opened the window
+            self.ack_event.wait(timeout=self.next_timeout_delay())
+            self.ack_event.clear()
             
+            self.drain_acks()
             self.check_timeouts()
         
         max_wait_time = 60  
-        start_wait = time.time()
+        start_wait = time.monotonic()
         last_ack_time = None 
         
         while len(self.unacked_packets) > 0:
-            current_time = time.time()
+            current_time = time.monotonic()
             
-            with self.lock:
-                if self.last_ack_received > -1:
-                    if last_ack_time is None:
-                        last_ack_time = current_time
-                    else:
-                        last_ack_time = current_time
+            if self.last_ack_received > -1:
+                if last_ack_time is None:
+                    last_ack_time = current_time
+                else:
+                    last_ack_time = current_time
             
-            time.sleep(0.1)
+            # Wake for the next ACK or retransmit deadline rather than a fixed tick
+            self.ack_event.wait(timeout=min(0.1, self.next_timeout_delay()))
+            self.ack_event.clear()
+            self.drain_acks()
             self.check_timeouts()
         
         time.sleep(1.0)
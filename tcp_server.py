@@ -8,6 +8,7 @@ import struct
 import random
 import time
 import threading
+import selectors
 import sys
 
 SEQ_NUM_SIZE = 4  
@@ -15,8 +16,14 @@ CHECKSUM_SIZE = 2
 ACK_SIZE = 4  
 CHUNK_SIZE = 1024  
 
+HEADER_STRUCT = struct.Struct('!IH')  # seq_num, checksum
+ACK_STRUCT = struct.Struct('!I')  
+
 RTT_DELAY = 0.1 
+RECV_TIMEOUT = 2.0 
+RECV_BATCH_SIZE = 128 
 DEFAULT_LOSS_PROB = 0.1 
+OUTPUT_FILE = 'received.txt' 
 
 class TCPServer:
     def __init__(self, host='localhost', port=8888, loss_prob=DEFAULT_LOSS_PROB):
@@ -25,20 +32,29 @@ class TCPServer:
         self.loss_prob = loss_prob
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((host, port))
+        # Non-blocking once; run() waits for readability on the selector
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
         
         self.expected_seq = 0  
         self.received_data = {}  
-        self.output_buffer = [] 
+        self.out_fp = None 
+        self.total_bytes = 0 
         
         self.ack_lock = threading.Lock()
         self.ack_timer_active = False
-        self.ack_timer_thread = None
+        self.ack_deadline = 0.0
+        self.ack_due = threading.Event()
         self.client_addr = None
         
         self.total_packets_received = 0
         self.total_packets_dropped = 0
         self.total_checksum_errors = 0
         
+        self.ack_worker = threading.Thread(target=self.ack_loop, daemon=True)
+        self.ack_worker.start()
+        
     def calculate_checksum(self, data):
         if not data:
             return 0
@@ -50,22 +66,32 @@ class TCPServer:
         return calculated_checksum == received_checksum
     
     def send_ack(self, client_addr, ack_num):
-        ack_packet = struct.pack('!I', ack_num)
-        self.sock.sendto(ack_packet, client_addr)
+        ack_packet = ACK_STRUCT.pack(ack_num)
+        try:
+            self.sock.sendto(ack_packet, client_addr)
+        except BlockingIOError:
+            pass  # a later cumulative ACK covers this one
     
-    def send_ack_after_rtt(self):
-        time.sleep(RTT_DELAY)
-        with self.ack_lock:
-            if self.ack_timer_active:
-                self.send_ack(self.client_addr, self.expected_seq)
-                self.ack_timer_active = False
+    def ack_loop(self):
+        while True:
+            self.ack_due.wait()
+            self.ack_due.clear()
+            
+            with self.ack_lock:
+                delay = self.ack_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            
+            with self.ack_lock:
+                if self.ack_timer_active:
+                    self.send_ack(self.client_addr, self.expected_seq)
+                    self.ack_timer_active = False
     
     def process_packet(self, packet_data, client_addr):
         if len(packet_data) < SEQ_NUM_SIZE + CHECKSUM_SIZE:
             return  
         
-        seq_num = struct.unpack('!I', packet_data[:SEQ_NUM_SIZE])[0]
-        checksum = struct.unpack('!H', packet_data[SEQ_NUM_SIZE:SEQ_NUM_SIZE+CHECKSUM_SIZE])[0]
+        seq_num, checksum = HEADER_STRUCT.unpack_from(packet_data)
         data = packet_data[SEQ_NUM_SIZE + CHECKSUM_SIZE:]
         
         if random.random() < self.loss_prob:
@@ -94,51 +120,65 @@ class TCPServer:
             with self.ack_lock:
                 if not self.ack_timer_active:
                     self.ack_timer_active = True
-                    self.ack_timer_thread = threading.Thread(target=self.send_ack_after_rtt, daemon=True)
-                    self.ack_timer_thread.start()
+                    self.ack_deadline = time.monotonic() + RTT_DELAY
+                    self.ack_due.set()
         
         while self.expected_seq in self.received_data:
-            self.output_buffer.append(self.received_data.pop(self.expected_seq))
-            self.expected_seq += len(self.output_buffer[-1])
+            chunk = self.received_data.pop(self.expected_seq)
+            if self.out_fp is None:
+                self.out_fp = open(OUTPUT_FILE, 'wb')
+            self.out_fp.write(chunk)
+            self.total_bytes += len(chunk)
+            self.expected_seq += len(chunk)
+    
+    def receive_batch(self):
+        if not self.selector.select(timeout=RECV_TIMEOUT):
+            raise socket.timeout
+        
+        # Drain whatever is already queued, up to one batch
+        packets = []
+        try:
+            while len(packets) < RECV_BATCH_SIZE:
+                packets.append(self.sock.recvfrom(65507))
+        except BlockingIOError:
+            pass
+        return packets
     
     def run(self):
         client_addr = None
         last_packet_time = None
         completion_timeout = 30.0 
         
-        self.sock.settimeout(2.0) 
-        
         while True:
             try:
-                packet_data, addr = self.sock.recvfrom(65507)  
+                packets = self.receive_batch()
+                if not packets:
+                    continue
                 
                 if client_addr is None:
-                    client_addr = addr
-                    print(f"Client connected from {addr}")
+                    client_addr = packets[0][1]
+                    print(f"Client connected from {client_addr}")
                 
-                self.process_packet(packet_data, client_addr)
+                for packet_data, addr in packets:
+                    self.process_packet(packet_data, client_addr)
                 last_packet_time = time.time()
                 
             except socket.timeout:
                 if last_packet_time and (time.time() - last_packet_time) > completion_timeout:
                     if self.expected_seq > 0:
-                        if len(self.output_buffer) > 0:
+                        if self.total_bytes > 0:
                             break 
                 continue
             except Exception as e:
                 print(f"Error: {e}")
                 continue
         
-        if self.output_buffer:
-            output_file = 'received.txt'
-            with open(output_file, 'wb') as f:
-                for chunk in self.output_buffer:
-                    f.write(chunk)
-            
-            total_bytes = sum(len(chunk) for chunk in self.output_buffer)
+        if self.out_fp is not None:
+            self.out_fp.close()
             print(f"\nFile transfer complete")
-            print(f"Total bytes received: {total_bytes}")
+            print(f"Total bytes received: {self.total_bytes}")
         
+        self.selector.close()
         self.sock.close()
 
 def main():